@@ -2,31 +2,39 @@ import argparse
 import boto3
 import labelbox as lb
 import os
+import re
+import sys
 
 from botocore import UNSIGNED
 from botocore.client import Config
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+# Close-up, wide and med picture names, capturing the polygon id (tele and legacy zoom conventions)
+CLOSEUP_PATTERN = re.compile(r'_([^_/]+?)(?:tele|zoom)\.jpg$', re.IGNORECASE)
+WIDE_PATTERN = re.compile(r'_([^_/]+)wide\.JPG$')
+LEGACY_WIDE_PATTERN = re.compile(r'_([^_/]+)\.JPG$')
+MED_PATTERN = re.compile(r'_([^_/]+)med\.JPG$')
 
-def get_mission_files(mission_id, alliancecan_url, bucket_wpt, aws_access_key_id=None, aws_secret_access_key=None):
+# Maximum number of missions processed concurrently
+MAX_WORKERS = 8
+
+
+def get_s3_client(alliancecan_url, aws_access_key_id=None, aws_secret_access_key=None):
     """
-    Fetch all files for a given mission from Alliance Canada.
+    Create an S3 client for Alliance Canada, shared by all missions.
     
     Args:
-        mission_id (str): Mission ID to fetch files for
         alliancecan_url (str): Base URL for Alliance Canada
-        bucket_wpt (str): Bucket name for WPT mission files
         aws_access_key_id (str): AWS access key ID (optional)
         aws_secret_access_key (str): AWS secret access key (optional)
     Returns:
-        tuple: (file_keys, closeup_files, folder_url)
+        S3 client instance
     """
-    # List all pictures on Alliance Canada for a given mission
-
     # Configure S3 client for Alliance Canada (S3-compatible storage)
     if aws_access_key_id and aws_secret_access_key:
         # Use credentials if provided
-        s3_client = boto3.client(
+        return boto3.client(
             's3',
             endpoint_url=alliancecan_url,
             aws_access_key_id=aws_access_key_id,
@@ -35,12 +43,27 @@ def get_mission_files(mission_id, alliancecan_url, bucket_wpt, aws_access_key_id
         )
     else:
         # Use anonymous access (public bucket)
-        s3_client = boto3.client(
+        return boto3.client(
             's3',
             endpoint_url=alliancecan_url,
             config=Config(signature_version=UNSIGNED)
         )
 
+
+def get_mission_files(s3_client, mission_id, alliancecan_url, bucket_wpt):
+    """
+    Fetch all files for a given mission from Alliance Canada.
+    
+    Args:
+        s3_client: S3 client instance
+        mission_id (str): Mission ID to fetch files for
+        alliancecan_url (str): Base URL for Alliance Canada
+        bucket_wpt (str): Bucket name for WPT mission files
+    Returns:
+        tuple: (closeup_files, naming_convention, wide_files, med_files, folder_url)
+    """
+    # List all pictures on Alliance Canada for a given mission
+
     # Use paginator to automatically handle pagination
     try:
         paginator = s3_client.get_paginator('list_objects_v2')
@@ -55,8 +78,8 @@ def get_mission_files(mission_id, alliancecan_url, bucket_wpt, aws_access_key_id
                     if key.lower().endswith('.jpg'):
                         file_keys.append(key)
     except Exception as e:
-        print(f"Failed to retrieve files from S3 bucket: {e}")
-        return None, None, None
+        print(f"Failed to retrieve files from S3 bucket for {mission_id}: {e}")
+        return None, None, None, None, None
 
     # Construct folder URL for generating asset URLs
     folder_url = f"{alliancecan_url}/{bucket_wpt}"
@@ -64,78 +87,117 @@ def get_mission_files(mission_id, alliancecan_url, bucket_wpt, aws_access_key_id
     # Print the result
     print(f"{len(file_keys)} pictures found for this mission : {mission_id}")
 
-    # Filter for close-up pictures (detect naming convention)
-    closeup_files = [key for key in file_keys if "tele" in key]
-    if closeup_files:
+    # Classify close-up, wide and med pictures in a single pass
+    tele_files, zoom_files, med_files, wide_files, other_files = [], [], [], [], []
+    for key in file_keys:
+        lower_key = key.lower()
+        if "tele" in lower_key:
+            tele_files.append(key)
+        elif "zoom" in lower_key:
+            zoom_files.append(key)
+        elif "med" in lower_key:
+            med_files.append(key)
+        elif "wide" in lower_key:
+            wide_files.append(key)
+        else:
+            other_files.append(key)
+
+    # Detect naming convention
+    closeup_files = tele_files or zoom_files
+    naming_convention = None
+    if tele_files:
+        naming_convention = "tele"
         print(f"{len(closeup_files)} close-up pictures (tele) found for this mission : {mission_id}")
+    elif zoom_files:
+        naming_convention = "zoom"
+        # Legacy zoom: wide files have no keyword
+        wide_files = wide_files + other_files
+        print(f"Using legacy naming convention (zoom) for this mission : {mission_id}")
+        print(f"{len(closeup_files)} close-up pictures (zoom) found for this mission : {mission_id}")
     else:
-        closeup_files = [key for key in file_keys if "zoom" in key]
-        if closeup_files:
-            print("Using legacy naming convention (zoom).")
-            print(f"{len(closeup_files)} close-up pictures (zoom) found for this mission : {mission_id}")
-        else:
-            print(f"No close-up pictures found for this mission : {mission_id}")
+        print(f"No close-up pictures found for this mission : {mission_id}")
     
-    return file_keys, closeup_files, folder_url
+    return closeup_files, naming_convention, wide_files, med_files, folder_url
 
 
-def delete_attachments(client, closeup_files):
+def delete_attachments(dataset, closeup_files, mission_id):
     """
     Delete all existing attachments for each data row in the dataset.
     
     Args:
-        client: Labelbox client instance
+        dataset: Labelbox dataset containing the data rows
         closeup_files (list): List of close-up file keys
+        mission_id (str): Mission ID
     """
-    print("Deleting existing attachments...")
-    for i, closeup_file in enumerate(closeup_files):
+    print(f"Deleting existing attachments for this mission : {mission_id}")
+    rows = []
+    for closeup_file in closeup_files:
         # Find data by global_key
         file = closeup_file.split('/', 1)[-1]
-        data_row = client.get_data_row_by_global_key(file)
-        
-        dataset = data_row.dataset()
-        dataset.upsert_data_rows([{'key': lb.UniqueId(data_row.uid), 'attachments': []}])
-        
-        if (i + 1) % 10 == 0:
-            print(f"Deleted attachments for {i + 1}/{len(closeup_files)} data rows")
+        rows.append({'key': lb.GlobalKey(file), 'attachments': []})
+    
+    # Upsert all data rows in a single task
+    task = dataset.upsert_data_rows(rows)
+    task.wait_till_done()
+    
+    if task.errors:
+        print(f"Errors while deleting attachments for {mission_id}: {task.errors}")
     
-    print(f"Deleted attachments for all {len(closeup_files)} data rows")
+    print(f"Deleted attachments for all {len(closeup_files)} data rows of this mission : {mission_id}")
 
 
-def create_attachments(client, closeup_files, file_keys, folder_url, mission_id):
+def create_attachments(dataset, closeup_files, naming_convention, wide_files, med_files, folder_url, mission_id):
     """
-    Create new attachments for each data row in the dataset.
+    Replace the attachments of each data row in the dataset with new wide, med and map attachments.
     
     Args:
-        client: Labelbox client instance
+        dataset: Labelbox dataset containing the data rows
         closeup_files (list): List of close-up file keys (zoom or tele)
-        file_keys (list): List of all file keys
+        naming_convention (str): Naming convention detected by get_mission_files ("tele" or "zoom")
+        wide_files (list): List of wide file keys
+        med_files (list): List of med file keys
         folder_url (str): URL of the folder
         mission_id (str): Mission ID
     """
-    print("Creating new attachments...")
-    for i, closeup_file in enumerate(closeup_files):
+    print(f"Creating new attachments for this mission : {mission_id}")
+    
+    # Index wide and med files by polygon id
+    wide_pattern = WIDE_PATTERN if naming_convention == "tele" else LEGACY_WIDE_PATTERN
+    
+    wide_index = {}
+    for key in wide_files:
+        match = wide_pattern.search(key)
+        if match:
+            wide_index.setdefault(match.group(1), []).append(key)
+    
+    med_index = {}
+    for key in med_files:
+        match = MED_PATTERN.search(key)
+        if match:
+            med_index.setdefault(match.group(1), []).append(key)
+    
+    # Base URL of the map attachments
+    attachments_url = f"{folder_url}/{mission_id}/labelbox/attachments/"
+    
+    rows = []
+    for closeup_file in closeup_files:
         # Find data by global_key
         file = closeup_file.split('/', 1)[-1]
-        data_row = client.get_data_row_by_global_key(file)
+        attachments = []
         
         # Attach the map
-        closeup_basename = os.path.basename(closeup_file)
-        map_url = f"{folder_url}/labelbox/attachments/{closeup_basename.replace('.JPG', '.html')}"
+        closeup_basename = closeup_file.rpartition('/')[2]
+        map_url = f"{attachments_url}{closeup_basename[:-4]}.html"
         
-        # Detect naming convention and extract the polygon id
-        if "tele" in closeup_file:
-            polygon_id = closeup_file.split('_')[-1].lower().replace('tele.jpg', '')
-            wide_file_end = f"_{polygon_id}wide.JPG"
-            exclusion_keyword = "tele"
-        else:
-            # Legacy naming convention (zoom)
-            polygon_id = closeup_file.split('_')[-1].lower().replace('zoom.jpg', '')
-            wide_file_end = f"_{polygon_id}.JPG"
-            exclusion_keyword = "zoom"
+        # Extract the polygon id
+        closeup_match = CLOSEUP_PATTERN.search(closeup_file)
+        if not closeup_match:
+            print(f"Warning: Unable to extract the polygon id from {closeup_file}. Skipping.")
+            continue
+        polygon_id = closeup_match.group(1).lower()
         
-        # Find the corresponding wide file from file_keys
-        matching_wide_files = [key for key in file_keys if wide_file_end in key and exclusion_keyword not in key]
+        # Find the corresponding wide file from the index
+        matching_wide_files = wide_index.get(polygon_id, [])
         
         if len(matching_wide_files) > 1:
             print(f"Warning: Multiple wide pictures found for {closeup_file}: {matching_wide_files}. Using the first match.")
@@ -143,16 +205,31 @@ def create_attachments(client, closeup_files, file_keys, folder_url, mission_id)
         wide_file = matching_wide_files[0] if matching_wide_files else None
         
         if wide_file:
-            data_row.create_attachment(attachment_type="IMAGE", attachment_value=f"{folder_url}/{wide_file}", attachment_name="wide")
+            attachments.append({'type': "IMAGE", 'value': f"{folder_url}/{wide_file}", 'name': "wide"})
         else:
             print(f"Warning: No wide file found for {closeup_file} (polygon_id: {polygon_id})")
         
-        data_row.create_attachment(attachment_type="HTML", attachment_value=map_url, attachment_name="map")
+        # Find the corresponding med file (optional)
+        matching_med_files = med_index.get(polygon_id, [])
+        
+        if len(matching_med_files) > 1:
+            print(f"Warning: Multiple med pictures found for {closeup_file}: {matching_med_files}. Using the first match.")
+        
+        if matching_med_files:
+            attachments.append({'type': "IMAGE", 'value': f"{folder_url}/{matching_med_files[0]}", 'name': "med"})
+        
+        attachments.append({'type': "HTML", 'value': map_url, 'name': "map"})
         
-        if (i + 1) % 10 == 0:
-            print(f"Created attachments for {i + 1}/{len(closeup_files)} data rows")
+        rows.append({'key': lb.GlobalKey(file), 'attachments': attachments})
     
-    print(f"Created attachments for all {len(closeup_files)} data rows")
+    # Upsert all data rows in a single task
+    task = dataset.upsert_data_rows(rows)
+    task.wait_till_done()
+    
+    if task.errors:
+        print(f"Errors while creating attachments for {mission_id}: {task.errors}")
+    
+    print(f"Created attachments for all {len(closeup_files)} data rows of this mission : {mission_id}")
 
 # OR
 # Update attachments instead of delete-create
@@ -181,16 +258,61 @@ def create_attachments(client, closeup_files, file_keys, folder_url, mission_id)
 #     for attachment in attachments_to_update:
 #         attachment.update(value=f"{folder_url}/{wide_file}")
 
+def process_mission(client, s3_client, mission_id, project, delete, create, alliancecan_url, bucket_wpt):
+    """
+    Delete and/or create the attachments of the data rows of a mission.
+    
+    Args:
+        client: Labelbox client instance
+        s3_client: S3 client instance
+        mission_id (str): Mission ID
+        project (str): Project name, used as dataset name prefix
+        delete (bool): Delete existing attachments
+        create (bool): Create new attachments
+        alliancecan_url (str): Base URL for Alliance Canada
+        bucket_wpt (str): Bucket name for WPT mission files
+    """
+    # Check if the dataset already exists
+    dataset_name = f"{project}_{mission_id}"
+    existing_datasets = client.get_datasets(where=lb.Dataset.name == dataset_name)
+    existing_dataset = next(iter(existing_datasets), None)
+    
+    if existing_dataset:
+        print(f"Dataset {dataset_name} found.")
+    else:
+        print(f"Dataset {dataset_name} not found.")
+        return
+    
+    # Get mission files
+    closeup_files, naming_convention, wide_files, med_files, folder_url = get_mission_files(s3_client, mission_id, alliancecan_url, bucket_wpt)
+    
+    if not closeup_files:
+        print(f"No close-up files found for this mission : {mission_id}. Skipping.")
+        return
+    
+    # Execute requested operations
+    # Creating attachments upserts the full list, which replaces existing ones, so no separate delete is needed
+    if delete and not create:
+        delete_attachments(existing_dataset, closeup_files, mission_id)
+    
+    if create:
+        create_attachments(existing_dataset, closeup_files, naming_convention, wide_files, med_files, folder_url, mission_id)
+
+
 def main():
     """Main function to manage data row attachments in Labelbox."""
     # Parse command-line arguments
     parser = argparse.ArgumentParser(description="Manage data row attachments in Labelbox.")
-    parser.add_argument("--mission_id", required=True, help="Mission ID to process.")
+    parser.add_argument("--mission_id", required=True, action="append", help="Mission ID to process. Repeat to process several missions.")
     parser.add_argument("--project", required=True, help="Project name.")
     parser.add_argument("-d", "--delete", action="store_true", help="Delete existing attachments.")
-    parser.add_argument("-c", "--create", action="store_true", help="Create new attachments.")
+    parser.add_argument("-c", "--create", action="store_true", help="Create new attachments, replacing the existing ones.")
     args = parser.parse_args()
     
+    if not args.delete and not args.create:
+        print("No operation specified. Use -d to delete attachments or -c to create attachments.")
+        return
+    
     # Load environment variables from .env file
     load_dotenv()
     
@@ -211,36 +333,26 @@ def main():
     if not AWS_ACCESS_KEY_ID or not AWS_SECRET_ACCESS_KEY:
         print("AWS_ACCESS_KEY_ID and/or AWS_SECRET_ACCESS_KEY environment variables are not set. Assuming public bucket access.")
 
-    # Initialize Labelbox client
+    # Initialize Labelbox and S3 clients once for all missions
     client = lb.Client(api_key=LABELBOX_API_KEY)
+    s3_client = get_s3_client(ALLIANCECAN_URL, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY)
     
-    # Check if the dataset already exists
-    existing_datasets = client.get_datasets()
-    dataset_name = f"{args.project}_{args.mission_id}"
-    existing_dataset = next((ds for ds in existing_datasets if ds.name == dataset_name), None)
+    # Process missions concurrently, overlapping their S3 and Labelbox calls
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = [(mission_id, executor.submit(process_mission, client, s3_client, mission_id, args.project, args.delete, args.create, ALLIANCECAN_URL, BUCKET_WPT)) for mission_id in args.mission_id]
     
-    if existing_dataset:
-        print(f"Dataset {dataset_name} found.")
-    else:
-        print(f"Dataset {dataset_name} not found.")
-        return
+    # Report every failed mission, not only the first one
+    failed_missions = []
+    for mission_id, future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            print(f"Failed to process mission {mission_id}: {e}")
+            failed_missions.append(mission_id)
     
-    # Get mission files
-    file_keys, closeup_files, folder_url = get_mission_files(args.mission_id, ALLIANCECAN_URL, BUCKET_WPT, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY)
-    
-    if not closeup_files:
-        print("No close-up files found. Exiting.")
-        return
-    
-    # Execute requested operations
-    if args.delete:
-        delete_attachments(client, closeup_files)
-    
-    if args.create:
-        create_attachments(client, closeup_files, file_keys, folder_url, args.mission_id)
-    
-    if not args.delete and not args.create:
-        print("No operation specified. Use -d to delete attachments or -c to create attachments.")
+    if failed_missions:
+        print(f"{len(failed_missions)}/{len(futures)} missions failed: {failed_missions}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,9 @@
 import argparse
 import boto3
-import copy
 import labelbox as lb
 import logging
 import os
+import re
 import sys
 
 from botocore import UNSIGNED
@@ -128,31 +128,39 @@ folder_url = f"{ALLIANCECAN_URL}/{BUCKET_WPT}"
 # Print the result
 logger.info(f"{len(file_keys)} pictures found for this mission : {mission}")
 
-# Filter for close-up pictures (detect naming convention)
-closeup_files = [key for key in file_keys if "tele" in key]
-if closeup_files:
+# Classify close-up, wide and med pictures in a single pass
+tele_files, zoom_files, med_files_all, wide_files_all, other_files = [], [], [], [], []
+for key in file_keys:
+    lower_key = key.lower()
+    if "tele" in lower_key:
+        tele_files.append(key)
+    elif "zoom" in lower_key:
+        zoom_files.append(key)
+    elif "med" in lower_key:
+        med_files_all.append(key)
+    elif "wide" in lower_key:
+        wide_files_all.append(key)
+    else:
+        other_files.append(key)
+
+# Detect naming convention
+if tele_files:
+    closeup_files = tele_files
     exclusion_keyword = "tele"
     logger.info(f"{len(closeup_files)} close-up pictures (tele) found for this mission : {mission}")
 
+elif zoom_files:
+    closeup_files = zoom_files
+    exclusion_keyword = "zoom"
+    # Legacy zoom: wide files have no keyword
+    wide_files_all = wide_files_all + other_files
+    logger.info("Using legacy naming convention (zoom).")
+    logger.info(f"{len(closeup_files)} close-up pictures (zoom) found for this mission : {mission}")
 else:
-    closeup_files = [key for key in file_keys if "zoom" in key]
-    if closeup_files:
-        exclusion_keyword = "zoom"
-        logger.info("Using legacy naming convention (zoom).")
-        logger.info(f"{len(closeup_files)} close-up pictures (zoom) found for this mission : {mission}")
-    else:
-        logger.error(f"No close-up pictures found for this mission : {mission}")
-        sys.exit(1)
+    logger.error(f"No close-up pictures found for this mission : {mission}")
+    sys.exit(1)
 
 # Verify that wide (and med) picture counts match close-up count
-if exclusion_keyword == "tele":
-    wide_files_all = [key for key in file_keys if "wide" in key.lower()]
-else:
-    # Legacy zoom: wide files have no keyword, so exclude zoom and med
-    wide_files_all = [key for key in file_keys if "zoom" not in key.lower() and "med" not in key.lower()]
-
-med_files_all = [key for key in file_keys if "med" in key.lower()]
-
 logger.info(f"{len(wide_files_all)} wide pictures found for this mission : {mission}")
 
 if len(wide_files_all) != len(closeup_files):
@@ -167,9 +175,9 @@ if med_files_all:
 
 # Import data rows into Labelbox dataset named after the project
 # Check if the dataset already exists
-existing_datasets = client.get_datasets()
 dataset_name = project
-existing_dataset = next((ds for ds in existing_datasets if ds.name == dataset_name), None)
+existing_datasets = client.get_datasets(where=lb.Dataset.name == dataset_name)
+existing_dataset = next(iter(existing_datasets), None)
 
 if existing_dataset:
     logger.info(f"Dataset {dataset_name} already exists. Importing data rows into this dataset.")
@@ -178,55 +186,50 @@ else:
     logger.info(f"Creating new dataset {dataset_name}")
     dataset = client.create_dataset(name=dataset_name)
 
-# Base asset template
-assets_template = {
-    "row_data": "",
-    "global_key": "",
-    "media_type": "IMAGE",
-    "metadata_fields": [{"name": "mission", "value": ""},
-                        {"name": "polygon", "value": ""}],
-    "attachments": [{"type": "IMAGE", "value": "", "name": "wide"},
-                    {"type": "HTML", "value": "", "name": "map"}]
-}
+# Index wide and med files by polygon id
+if exclusion_keyword == "tele":
+    wide_pattern = re.compile(r'_([^_/]+)wide\.JPG$')
+else:
+    # Legacy naming convention (zoom)
+    wide_pattern = re.compile(r'_([^_/]+)\.JPG$')
+med_pattern = re.compile(r'_([^_/]+)med\.JPG$')
+closeup_pattern = re.compile(r'_([^_/]+?)(?:tele|zoom)\.jpg$', re.IGNORECASE)
+
+wide_index = {}
+med_index = {}
+for key in wide_files_all:
+    wide_match = wide_pattern.search(key)
+    if wide_match:
+        wide_index.setdefault(wide_match.group(1), []).append(key)
+for key in med_files_all:
+    med_match = med_pattern.search(key)
+    if med_match:
+        med_index.setdefault(med_match.group(1), []).append(key)
+
+# Base URL of the map attachments
+attachments_url = f"{folder_url}/{mission}/labelbox/attachments/"
 
 # Create a list of assets
 assets = []
 
 for i, closeup_file in enumerate(closeup_files):
-    # Make a copy of the template for each asset
-    asset = copy.deepcopy(assets_template)
-    
-    # Replace row_data with the current closeup_file (URL)
-    asset["row_data"] = f"{folder_url}/{closeup_file}"
-    
     # Use file name as unique global_key
     file = closeup_file.split('/', 1)[-1]
-    asset["global_key"] = file
-    
-    # Metadata fields : mission
-    asset["metadata_fields"][0]["value"] = f"{mission}" 
-    
-    # Extract the polygon id and determine matching file suffixes
-    if exclusion_keyword == "tele":
-        polygon_id = closeup_file.split('_')[-1].lower().replace('tele.jpg', '')
-        wide_file_end = f"_{polygon_id}wide.JPG"
-    else:
-        # Legacy naming convention (zoom)
-        polygon_id = closeup_file.split('_')[-1].lower().replace('zoom.jpg', '')
-        wide_file_end = f"_{polygon_id}.JPG"
     
-    # Metadata fields : polygon_id
-    asset["metadata_fields"][1]["value"] = f"{polygon_id}" 
+    # Extract the polygon id
+    closeup_match = closeup_pattern.search(closeup_file)
+    if not closeup_match:
+        logger.error(f"Unable to extract the polygon id from {closeup_file}. Exiting.")
+        sys.exit(1)
+    polygon_id = closeup_match.group(1).lower()
     
     # Attach the map
-    closeup_basename = os.path.basename(closeup_file)
-    map_url = f"{folder_url}/{mission}/labelbox/attachments/{closeup_basename.replace('.JPG', '.html')}"
-    
-    asset["attachments"][1]["value"] = map_url
+    closeup_basename = closeup_file.rpartition('/')[2]
+    map_url = f"{attachments_url}{closeup_basename[:-4]}.html"
     
-    # Find the corresponding wide file from file_keys
+    # Find the corresponding wide file from the index
     wide_file = None
-    matching_wide_files = [key for key in file_keys if wide_file_end in key and exclusion_keyword not in key]
+    matching_wide_files = wide_index.get(polygon_id, [])
     
     if len(matching_wide_files) > 1:
         logger.error(f"Multiple wide pictures found for {closeup_file}: {matching_wide_files}. Exiting.")
@@ -234,16 +237,14 @@ for i, closeup_file in enumerate(closeup_files):
 
     wide_file = matching_wide_files[0] if matching_wide_files else None
     
-    # If a wide file is found, set the attachment value
-    if wide_file:
-        asset["attachments"][0]["value"] = f"{folder_url}/{wide_file}"
-    else:
+    if not wide_file:
         logger.error(f"No wide file found for {closeup_file}. Exiting.")
         sys.exit(1)
 
+    attachments = [{"type": "IMAGE", "value": f"{folder_url}/{wide_file}", "name": "wide"}]
+
     # Find the corresponding med file (optional)
-    med_file_end = f"_{polygon_id}med.JPG"
-    matching_med_files = [key for key in file_keys if med_file_end in key]
+    matching_med_files = med_index.get(polygon_id, [])
 
     if len(matching_med_files) > 1:
         logger.error(f"Multiple med pictures found for {closeup_file}: {matching_med_files}. Exiting.")
@@ -252,21 +253,36 @@ for i, closeup_file in enumerate(closeup_files):
     med_file = matching_med_files[0] if matching_med_files else None
 
     if med_file:
-        asset["attachments"].insert(1, {"type": "IMAGE", "value": f"{folder_url}/{med_file}", "name": "med"})
+        attachments.append({"type": "IMAGE", "value": f"{folder_url}/{med_file}", "name": "med"})
+
+    attachments.append({"type": "HTML", "value": map_url, "name": "map"})
 
-    # Add the updated asset to the list
-    assets.append(asset)
+    # Build the asset and add it to the list
+    assets.append({
+        "row_data": f"{folder_url}/{closeup_file}",
+        "global_key": file,
+        "media_type": "IMAGE",
+        "metadata_fields": [{"name": "mission", "value": f"{mission}"},
+                            {"name": "polygon", "value": f"{polygon_id}"}],
+        "attachments": attachments
+    })
+
+# Import data in Labelbox, in chunks to stay under the per-request upload limit
+CREATE_BATCH_SIZE = 5000
 
-# Import data in Labelbox
 if not assets:
     logger.error("No valid assets to upload. Exiting.")
     sys.exit(1)
 else:
-    task = dataset.create_data_rows(assets)
-    task.wait_till_done()
-    errors = task.errors
-
-    if errors is None:
+    # Submit all chunks first so they are processed concurrently, then wait for each
+    tasks = [dataset.create_data_rows(assets[i:i + CREATE_BATCH_SIZE]) for i in range(0, len(assets), CREATE_BATCH_SIZE)]
+    errors = []
+    for task in tasks:
+        task.wait_till_done()
+        if task.errors:
+            errors.extend(task.errors)
+
+    if not errors:
         logger.info("No errors while importing data to Labelbox.")
     else:
         # Count duplicate global key errors
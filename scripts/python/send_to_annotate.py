@@ -3,8 +3,8 @@ import labelbox as lb
 import logging
 import os
 import sys
-import xml.etree.ElementTree as ET
 
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Setup logging with timestamp
@@ -42,24 +42,29 @@ client = lb.Client(api_key=LABELBOX_API_KEY)
 
 # Parse command-line arguments
 parser = argparse.ArgumentParser(description="Send data rows to Labelbox project.")
-parser.add_argument("--mission_id", required=True, help="Mission ID to generate the dataset.")
+parser.add_argument("--mission_id", required=True, action="append", help="Mission ID to generate the dataset. Repeat to send several missions.")
 parser.add_argument("--project", required=True, help="Project name where the data rows are sent.")
 parser.add_argument("--prefix", help="Prefix for the dataset name.")
 args = parser.parse_args()
 
-mission_id = args.mission_id
+mission_ids = args.mission_id
 project_name = args.project
 
-if args.prefix:
-    prefix = args.prefix
-else:
+# Maximum number of missions sent concurrently
+MAX_WORKERS = 8
+
+
+def get_prefix(mission_id):
+    """Return the dataset prefix for a mission, based on the site in its ID."""
+    if args.prefix:
+        return args.prefix
     parts = mission_id.split('_')
     if len(parts) >= 4:
         site = parts[1]
         if site.startswith('tbs'):
-            prefix = '2025_tiputini'
+            return '2025_tiputini'
         elif site.startswith('bci'):
-            prefix = '2024_bci'
+            return '2024_bci'
         else:
             logger.error("Site in mission ID is not recognized, unable to extract prefix for Labelbox dataset.")
             raise ValueError("Site in mission ID is not recognized, unable to extract prefix for Labelbox dataset. Please provide a prefix.")
@@ -67,22 +72,46 @@ else:
         logger.error("Mission ID does not follow expected format, unable to extract prefix for Labelbox dataset.")
         raise ValueError("Mission ID does not follow expected format, unable to extract prefix for Labelbox dataset. Please provide a prefix.")
 
-# Find the project by name
-projects = client.get_projects()
-project = next((p for p in projects if p.name == project_name), None)
+
+def send_mission(project, mission_id, prefix):
+    """Create a batch in the project from the dataset of a mission."""
+    dataset_name = f"{prefix}_{mission_id}"
+    datasets = client.get_datasets(where=lb.Dataset.name == dataset_name)
+    dataset = next(iter(datasets), None)
+    if not dataset:
+        logger.warning(f"Dataset '{dataset_name}' not found. Skipping.")
+    else:
+        batch = project.create_batches_from_dataset(
+            name_prefix=f"{mission_id}_",
+            dataset_id=dataset.uid,
+            priority=3
+        )
+        logger.info(f"Batch created for {mission_id}: {batch.result()}")
+
+
+# Resolve all prefixes before sending anything
+prefixes = {mission_id: get_prefix(mission_id) for mission_id in mission_ids}
+
+# Find the project by name (once for all missions)
+projects = client.get_projects(where=lb.Project.name == project_name)
+project = next(iter(projects), None)
 if not project:
     logger.error(f"Project '{project_name}' not found.")
+    sys.exit(1)
+
+# Send to annotate (create batches), overlapping the Labelbox calls of each mission
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+    futures = [(mission_id, executor.submit(send_mission, project, mission_id, prefixes[mission_id])) for mission_id in mission_ids]
+
+# Report every failed mission, not only the first one
+failed_missions = []
+for mission_id, future in futures:
+    try:
+        future.result()
+    except Exception as e:
+        logger.error(f"Failed to send mission {mission_id}: {e}")
+        failed_missions.append(mission_id)
 
-# Send to annotate (create batch)
-dataset_name = f"{prefix}_{mission_id}"
-datasets = client.get_datasets()
-dataset = next((ds for ds in datasets if ds.name == dataset_name), None)
-if not dataset:
-    logger.warning(f"Dataset '{dataset_name}' not found. Skipping.")
-else:
-    batch = project.create_batches_from_dataset(
-        name_prefix=f"{mission_id}_",
-        dataset_id=dataset.uid,
-        priority=3
-    )
-    logger.info(f"Batch created for {mission_id}: {batch.result()}")
+if failed_missions:
+    logger.error(f"{len(failed_missions)}/{len(futures)} missions failed: {failed_missions}")
+    sys.exit(1)